@@ -0,0 +1,35 @@
+import asyncio
+
+import web_bypass
+
+
+def run_race(monkeypatch, outcomes):
+    # outcomes: one (delay in seconds, result dict) per raced page, indexed by page
+    async def fake_bypass_once(page, url, attempt_num, include_screenshot=False):
+        delay, res = outcomes[page]
+        await asyncio.sleep(delay)
+        return res
+
+    monkeypatch.setattr(web_bypass, "bypass_once", fake_bypass_once)
+    return asyncio.run(web_bypass.race_bypass(list(range(len(outcomes))), "https://gplinks.co/abc", 1))
+
+
+CAPTCHA = {"final_url": "https://gplinks.co/abc", "captcha_detected": True}
+FINAL = {"final_url": "https://example.com/file", "captcha_detected": False}
+STUCK = {"final_url": "https://gplinks.co/abc", "captcha_detected": False}
+
+
+def test_final_result_beats_earlier_captcha(monkeypatch):
+    assert run_race(monkeypatch, [(0.01, CAPTCHA), (0.05, FINAL)]) == (1, FINAL)
+
+
+def test_final_result_wins_before_later_captcha(monkeypatch):
+    assert run_race(monkeypatch, [(0.05, CAPTCHA), (0.01, FINAL)]) == (1, FINAL)
+
+
+def test_non_captcha_result_is_kept_over_later_captcha(monkeypatch):
+    assert run_race(monkeypatch, [(0.01, STUCK), (0.05, CAPTCHA)]) == (0, STUCK)
+
+
+def test_captcha_is_returned_when_nothing_better_arrives(monkeypatch):
+    assert run_race(monkeypatch, [(0.01, CAPTCHA), (0.05, CAPTCHA)])[1] == CAPTCHA
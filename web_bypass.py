@@ -3,22 +3,31 @@
 Complete FastAPI + Playwright service and UI:
  - GET  /        -> simple web UI (sends POST to /bypass)
  - POST /bypass  -> bypass logic (click "Get link" etc.) returns JSON
+ - POST /clear_session -> forget saved shortener cookies
  - GET  /health  -> {"status":"ok"}
 
 Set API_KEY env var to require x-api-key header (optional).
+Set POOL_SIZE env var to change how many warm browser contexts are kept (default 2).
+Set STORAGE_STATE_PATH to choose where cookies are saved between restarts.
+Set CDP_URL (e.g. http://127.0.0.1:9222) to attach to an already running Chromium
+instead of launching one, so several uvicorn workers can share a single browser.
 """
 import os
 import re
+import asyncio
 import time
 import base64
 import logging
-from typing import Optional, List, Set
-from urllib.parse import urljoin, urlparse
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, List, Set, Dict
+from urllib.parse import urlparse
 
+import httpx
 from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from pydantic import BaseModel, AnyHttpUrl
-from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError, Response
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext, Page, TimeoutError as PlaywrightTimeoutError, Response, Route
 
 # -----------------------
 # Config
@@ -33,18 +42,123 @@ APP_PORT = int(os.environ.get("PORT", 8080))
 DEFAULT_HEADLESS = True
 NAV_TIMEOUT = 60_000        # ms
 CLICK_TIMEOUT = 12_000      # ms
-WAIT_AFTER_OPEN = 5         # seconds wait after opening initial gplinks page
+WAIT_AFTER_OPEN = 5         # max seconds to wait after opening initial gplinks page
 MAX_TOTAL_WAIT = 90         # seconds per attempt
+HTTP_FAST_PATH_TIMEOUT = 10  # seconds for the plain-HTTP redirect probe
+MAX_SCANNED_BODY = 256_000  # bytes; larger text/json responses are not read for links
+FAST_PATH_SCAN_BYTES = 64_000  # bytes of an HTML destination checked for interstitial markers
+POST_CLICK_WAIT = 2_000     # ms to wait for a click to navigate or update the page
 DEFAULT_ATTEMPTS = 3
+MAX_BACKOFF = 10            # seconds cap on the sleep between attempts
 MAX_NAV_HISTORY = 30
+POOL_SIZE = int(os.environ.get("POOL_SIZE", 2))   # warm contexts kept per browser
+MAX_CONTEXT_USES = 50       # requests served before a pooled context is recycled
+POOL_WAIT_CHECK = 5         # seconds between browser health checks while waiting for a context
+BROWSER_ARGS = [
+    "--no-sandbox", "--disable-dev-shm-usage",
+    # features that cost startup time/memory and do nothing for link extraction
+    "--disable-gpu", "--disable-extensions", "--disable-background-networking",
+    "--disable-default-apps", "--disable-sync", "--no-first-run", "--no-default-browser-check",
+    "--disable-features=Translate,BackForwardCache,InterestCohort",
+]
+RESULT_CACHE_TTL = 600      # seconds a successful result is reused
+RESULT_CACHE_SIZE = 1024
+SELECTOR_HINTS_SIZE = 1024  # hosts remembered with the fallback selector that worked there
+HOST_RTT_SIZE = 1024        # hosts whose average page load time is tracked for retry backoff
+FAST_RETRY_RTT = 2.0        # seconds; hosts loading faster than this are retried without backoff
+BLOCK_ASSETS = os.environ.get("BLOCK_ASSETS", "1") != "0"   # set 0 to load everything (e.g. for debug screenshots)
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}   # never needed to find the link
+BLOCKED_HOST_MARKERS = ("doubleclick", "googlesyndication", "adservice", "adsystem",
+                        "google-analytics", "googletagmanager", "facebook.net")
+STORAGE_STATE_PATH = os.environ.get("STORAGE_STATE_PATH", "/tmp/gplinks_state.json")   # cookies kept across restarts
+CDP_URL = os.environ.get("CDP_URL")   # external Chromium to attach to; headless is then up to that browser
+SCREENSHOT_QUALITY = 70     # JPEG quality for debug screenshots
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
 
 API_KEY = os.environ.get("API_KEY")
 
+# compiled once at import; used on every polling iteration
+HEROKU_LINK_RE = re.compile(r'https?://[A-Za-z0-9\-.]+herokuapp\.com/[^\s"\'<>]*generate\?code=[^"&\'<>]+')
+
+# any URL still on the shortener ("gplinks" also covers gplinks.co)
+SHORTENER_RE = re.compile(r"gplinks|get2\.in", re.IGNORECASE)
+
+# same markers DETECT_JS treats as a captcha, for pages fetched without the browser
+CAPTCHA_TEXT_RE = re.compile(r"captcha|i am not a robot|please verify", re.IGNORECASE)
+
+# button/link labels that usually reveal the destination; a regex source for CANDIDATES_JS,
+# which tests it against each candidate's lowercased label in the page
+GETLINK_TEXT_PATTERN = "|".join(map(re.escape, [
+    "get link", "get-link", "getlink", "get now", "show link", "click here",
+    "continue", "open link", "get url", "get code", "generate", "download"
+]))
+
+# runs inside the page so only a small dict crosses CDP instead of the full HTML;
+# the result is reused until a MutationObserver reports that the DOM changed
+DETECT_JS = r"""() => {
+  if (window.__bypassDetect && !window.__bypassDirty) return window.__bypassDetect;
+  if (!window.__bypassObserver) {
+    window.__bypassObserver = new MutationObserver(() => { window.__bypassDirty = true; });
+    window.__bypassObserver.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+  }
+  window.__bypassDirty = false;
+  const html = document.documentElement ? document.documentElement.outerHTML : "";
+  const m = html.match(/https?:\/\/[A-Za-z0-9\-.]+herokuapp\.com\/[^\s"'<>]*generate\?code=[^"&'<>]+/);
+  // "captcha" already covers recaptcha/hcaptcha, so one literal per concern
+  const captcha = /captcha|i am not a robot|please verify/i.test(html);
+  window.__bypassDetect = {link: m ? m[0] : null, captcha: captcha};
+  return window.__bypassDetect;
+}"""
+
+# filter click candidates in-page; matches are tagged so they can be located again for the click
+CLICK_CANDIDATE_SELECTOR = "a, button, input[type=button], input[type=submit]"
+CANDIDATES_JS = """([sel, pattern]) => {
+  const re = new RegExp(pattern);
+  const out = [];
+  const tagged = new Set();
+  for (const e of document.querySelectorAll(sel)) {
+    const label = ((e.innerText || "").trim() + " " + (e.getAttribute("aria-label") || "").trim()).toLowerCase().trim();
+    if (!re.test(label)) continue;
+    // only write changed tags so an unchanged page does not look mutated to DETECT_JS
+    const tag = String(out.length);
+    if (e.getAttribute("data-bypass-cand") !== tag) e.setAttribute("data-bypass-cand", tag);
+    tagged.add(e);
+    // e.href is already absolute; script pseudo-links are never a destination
+    const href = (e.href && !e.href.startsWith("javascript:")) ? e.href : null;
+    out.push({label: label, href: href, visible: e.getClientRects().length > 0});
+  }
+  document.querySelectorAll("[data-bypass-cand]").forEach(e => { if (!tagged.has(e)) e.removeAttribute("data-bypass-cand"); });
+  return out;
+}"""
+
+# generic click targets, most specific first
+FALLBACK_SELECTORS = [
+    "a#btn-main", "a[href*='redirect']", "a[href*='http']",
+    "a.btn", "button#btn-main", "button", "input[type=submit]", "a[role='button']"
+]
+FALLBACK_CLICK_JS = """(sels) => {
+  for (const s of sels) {
+    const el = document.querySelector(s);
+    if (el) { el.click(); return s; }
+  }
+  return null;
+}"""
+
 # -----------------------
 # FastAPI app
 # -----------------------
-app = FastAPI(title="GPLinks Bypass Full (UI + API)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # start the default browser pool before serving so the first request skips Chromium startup
+    try:
+        await get_context_pool(DEFAULT_HEADLESS)
+    except Exception:
+        logger.exception("Could not pre-start browser pool")
+    yield
+    await close_http_client()
+    await close_browser_pool()
+
+app = FastAPI(title="GPLinks Bypass Full (UI + API)", lifespan=lifespan)
 
 # -----------------------
 # Models
@@ -66,117 +180,172 @@ class BypassResponse(BaseModel):
 # -----------------------
 # Helpers
 # -----------------------
-def safe_log(msg: str):
+def safe_log(msg: str, *args):
+    # %-style args are only formatted when debug logging is on
     if DEBUG_LOGGING:
-        logger.debug(msg)
+        logger.debug(msg, *args)
 
 def looks_final(u: Optional[str]) -> bool:
     if not u:
         return False
-    s = u.lower()
-    return ("gplinks.co" not in s) and ("get2.in" not in s) and ("gplinks" not in s)
+    return SHORTENER_RE.search(u) is None
+
+def is_bypassed(final_url: Optional[str], url: str) -> bool:
+    # about:blank (parked pages) and chrome-error:// pages also "look final", but a failed
+    # navigation must not be cached or have its cookies saved as a success
+    if not final_url or final_url == url or not final_url.startswith(("http://", "https://")):
+        return False
+    return looks_final(final_url)
+
+def find_heroku_link(text: str) -> Optional[str]:
+    # cheap literal check first; the regex only runs when a match is possible
+    if not text or "generate?code=" not in text:
+        return None
+    m = HEROKU_LINK_RE.search(text)
+    return m.group(0) if m else None
 
-def resolve_href(base: str, href: str) -> str:
+async def take_screenshot(page: Page) -> bytes:
+    # viewport-only JPEG: far smaller than a full-page PNG and enough for debugging
+    return await page.screenshot(type="jpeg", quality=SCREENSHOT_QUALITY)
+
+async def find_heroku_link_in_page(page: Page) -> Optional[str]:
+    # match in the browser instead of pulling the whole document over with page.content()
     try:
-        return urljoin(base, href)
+        info = await page.evaluate(DETECT_JS) or {}
     except Exception:
-        return href
+        return None
+    return info.get("link")
 
-async def take_screenshot_b64(page: Page) -> str:
-    content = await page.screenshot(full_page=True)
-    return base64.b64encode(content).decode()
+async def wait_for_url_change(page: Page, old_url: str, timeout_ms: int):
+    # wake up as soon as the page commits a navigation away from old_url
+    try:
+        await page.wait_for_url(lambda u: u != old_url, wait_until="commit", timeout=timeout_ms)
+    except Exception:
+        pass
+
+# host -> fallback selector whose click last navigated a page on that host
+_selector_hints: "OrderedDict[str, str]" = OrderedDict()
+
+def fallback_selectors_for(url: str) -> List[str]:
+    host = urlparse(url).netloc.lower()
+    hint = _selector_hints.get(host)
+    if hint is None:
+        return FALLBACK_SELECTORS
+    _selector_hints.move_to_end(host)
+    return [hint] + [s for s in FALLBACK_SELECTORS if s != hint]
+
+def remember_selector(url: str, selector: str):
+    host = urlparse(url).netloc.lower()
+    _selector_hints[host] = selector
+    _selector_hints.move_to_end(host)
+    while len(_selector_hints) > SELECTOR_HINTS_SIZE:
+        _selector_hints.popitem(last=False)
+
+# host -> moving average of page.goto time (seconds), used to size retry backoff
+_host_rtt: "OrderedDict[str, float]" = OrderedDict()
+
+def record_host_rtt(url: str, elapsed: float):
+    host = urlparse(url).netloc.lower()
+    old = _host_rtt.get(host)
+    _host_rtt[host] = elapsed if old is None else 0.9 * old + 0.1 * elapsed
+    _host_rtt.move_to_end(host)
+    while len(_host_rtt) > HOST_RTT_SIZE:
+        _host_rtt.popitem(last=False)
+
+def retry_backoff(url: str, attempt: int) -> float:
+    # only called after a clean (no captcha) attempt that did not get off the shortener:
+    # exponential for hosts never seen, immediate for fast hosts, else scaled to their load time
+    backoff = min(MAX_BACKOFF, (2 ** attempt) + 0.5 * attempt)
+    rtt = _host_rtt.get(urlparse(url).netloc.lower())
+    if rtt is None:
+        return backoff
+    if rtt < FAST_RETRY_RTT:
+        return 0.0
+    return min(backoff, rtt * (1 + 0.5 * attempt))
 
 # click helper: find elements with "get link" style text and click them
 async def try_click_getlink_elements(page: Page):
-    patterns = ["get link", "get-link", "getlink", "get now", "show link", "click here",
-                "continue", "open link", "get url", "get code", "generate", "download"]
+    # one round-trip returns only the elements whose label looks like a get-link button
     try:
-        els = await page.query_selector_all("a, button, input[type=button], input[type=submit]")
+        candidates = await page.evaluate(CANDIDATES_JS, [CLICK_CANDIDATE_SELECTOR, GETLINK_TEXT_PATTERN])
     except Exception:
-        els = []
+        candidates = []
 
     base_url = page.url
-    for el in els:
+    for n, cand in enumerate(candidates):
         try:
-            txt = ""
-            aria = ""
-            href = None
-            try:
-                txt = (await el.inner_text() or "").strip().lower()
-            except Exception:
-                txt = ""
-            try:
-                aria = (await el.get_attribute("aria-label") or "").strip().lower()
-            except Exception:
-                aria = ""
-            try:
-                href = await el.get_attribute("href")
-            except Exception:
-                href = None
-
-            combined = f"{txt} {aria}".strip()
-            if any(p in combined for p in patterns):
-                safe_log(f"click candidate: text='{combined[:80]}' href={href}")
-                # try clicking
+            el = page.locator(f'[data-bypass-cand="{n}"]')
+            # a locator waits for its target, so a node an earlier click re-rendered away
+            # would burn CLICK_TIMEOUT; skip it instead
+            if not await el.count():
+                continue
+            href = cand.get("href")
+            safe_log("click candidate: text='%.80s' href=%s", cand.get("label", ""), href)
+            # try clicking; hidden elements would only burn CLICK_TIMEOUT in actionability checks
+            clicked = False
+            if cand.get("visible"):
                 try:
                     await el.click(timeout=CLICK_TIMEOUT)
+                    clicked = True
                 except Exception:
-                    try:
-                        await page.evaluate("(e)=>e.click()", el)
-                    except Exception:
-                        pass
-                # wait briefly for navigation/xhr
-                try:
-                    await page.wait_for_load_state("networkidle", timeout=5000)
-                except Exception:
-                    await page.wait_for_timeout(1200)
-
-                # if navigated
-                new_url = page.url
-                if new_url and new_url != base_url:
-                    # try to prefer heroku generate if present
-                    try:
-                        txtall = await page.content()
-                        m = re.search(r'https?://[A-Za-z0-9\-.]+herokuapp\.com/[^\s"\'<>]*generate\?code=[^"&\'<>]+', txtall)
-                        if m:
-                            return m.group(0)
-                    except Exception:
-                        pass
-                    return new_url
-
-                # if no navigation, check href
-                if href:
-                    full = resolve_href(base_url, href)
-                    if looks_final(full) or "herokuapp.com" in full or "/generate?code=" in full:
-                        return full
-
-                # scan page content for heroku link
+                    pass
+            if not clicked:
                 try:
-                    txtall = await page.content()
-                    m2 = re.search(r'https?://[A-Za-z0-9\-.]+herokuapp\.com/[^\s"\'<>]*generate\?code=[^"&\'<>]+', txtall)
-                    if m2:
-                        return m2.group(0)
+                    await el.evaluate("(e)=>e.click()", timeout=2000)
                 except Exception:
                     pass
+            # wait briefly for navigation/xhr; networkidle rarely settles on ad-heavy pages
+            await wait_for_url_change(page, base_url, POST_CLICK_WAIT)
+            try:
+                await page.wait_for_load_state("domcontentloaded", timeout=1200)
+            except Exception:
+                pass
+
+            # if navigated
+            new_url = page.url
+            if new_url and new_url != base_url:
+                # try to prefer heroku generate if present
+                link = await find_heroku_link_in_page(page)
+                if link:
+                    return link
+                return new_url
+
+            # if no navigation, check href
+            if href:
+                if looks_final(href) or "herokuapp.com" in href or "/generate?code=" in href:
+                    return href
+
+            # scan page content for heroku link
+            link = await find_heroku_link_in_page(page)
+            if link:
+                return link
         except Exception:
             pass
     return None
 
 # network listener helper
-def make_response_listener(found_set: Set[str]):
+def make_response_listener(found_set: Set[str], found_event: Optional[asyncio.Event] = None):
+    def found(u: str):
+        found_set.add(u)
+        if found_event is not None:
+            found_event.set()
+
     async def on_response(resp: Response):
         try:
             u = resp.url
             if "herokuapp.com" in u or "/generate?code=" in u:
-                found_set.add(u)
+                found(u)
             # best-effort body scan for small text/json responses
             try:
-                ct = resp.headers.get("content-type", "")
-                if ("json" in ct or "text" in ct) and len(u) < 800:
+                headers = resp.headers
+                ct = headers.get("content-type", "")
+                size = headers.get("content-length")
+                too_big = size is not None and size.isdigit() and int(size) > MAX_SCANNED_BODY
+                if ("json" in ct or "text" in ct) and len(u) < 800 and not too_big:
                     txt = await resp.text()
-                    m = re.search(r'https?://[A-Za-z0-9\-.]+herokuapp\.com/[^\s"\'<>]*generate\?code=[^"&\'<>]+', txt)
-                    if m:
-                        found_set.add(m.group(0))
+                    link = find_heroku_link(txt)
+                    if link:
+                        found(link)
             except Exception:
                 pass
         except Exception:
@@ -184,31 +353,44 @@ def make_response_listener(found_set: Set[str]):
     return on_response
 
 # main bypass attempt that follows links and returns last opened URL
-async def bypass_once(page: Page, url: str, attempt_num: int):
-    result = {"final_url": url, "raw_last_url": url, "captcha_detected": False, "screenshot_b64": None}
+async def bypass_once(page: Page, url: str, attempt_num: int, include_screenshot: bool = False):
+    result = {"final_url": url, "raw_last_url": url, "captcha_detected": False, "screenshot": None,
+              "selector_hint": None}
     nav_history: List[str] = []
     found_network_urls: Set[str] = set()
+    found_event = asyncio.Event()
+
+    async def snap():
+        # screenshots cost a CDP round-trip, so only take them when asked for;
+        # raw bytes are kept and base64-encoded once, for the attempt that is returned
+        if not include_screenshot:
+            return
+        try:
+            result["screenshot"] = await take_screenshot(page)
+        except Exception:
+            pass
 
-    listener = make_response_listener(found_network_urls)
+    listener = make_response_listener(found_network_urls, found_event)
     page.on("response", listener)
 
     try:
-        logger.info(f"Bypass attempt #{attempt_num} start")
+        logger.info("Bypass attempt #%d start", attempt_num)
         try:
-            await page.goto(url, timeout=NAV_TIMEOUT)
+            started = time.monotonic()
+            await page.goto(url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT)
+            record_host_rtt(url, time.monotonic() - started)
         except PlaywrightTimeoutError:
             safe_log("page.goto timeout")
         except Exception as e:
-            safe_log(f"page.goto exception: {e}")
+            safe_log("page.goto exception: %s", e)
 
-        # wait exactly WAIT_AFTER_OPEN seconds (you requested 5s)
+        # wait up to WAIT_AFTER_OPEN seconds, but stop early once we land off the shortener
         try:
-            await page.wait_for_timeout(WAIT_AFTER_OPEN * 1000)
+            await page.wait_for_url(looks_final, wait_until="commit", timeout=WAIT_AFTER_OPEN * 1000)
         except Exception:
             pass
 
         nav_history.append(page.url)
-        start_time = time.time()
         last_url = page.url
 
         def push_history(u: str):
@@ -217,134 +399,113 @@ async def bypass_once(page: Page, url: str, attempt_num: int):
             if not nav_history or nav_history[-1] != u:
                 nav_history.append(u)
 
-        while time.time() - start_time < MAX_TOTAL_WAIT and len(nav_history) < MAX_NAV_HISTORY:
-            current_url = page.url
-            result["raw_last_url"] = current_url
-
-            # if network discovered interesting url, return it
-            if found_network_urls:
-                chosen = sorted(found_network_urls)[0]
-                result["final_url"] = chosen
-                try:
-                    result["screenshot_b64"] = await take_screenshot_b64(page)
-                except Exception:
-                    pass
-                result["nav_history"] = nav_history
-                return result
-
-            # try clicking get link elements
-            click_res = await try_click_getlink_elements(page)
-            if click_res:
-                push_history(page.url)
-                result["final_url"] = click_res
-                try:
-                    result["screenshot_b64"] = await take_screenshot_b64(page)
-                except Exception:
-                    pass
-                result["nav_history"] = nav_history
-                return result
-
-            # update history if changed
-            if page.url != last_url:
-                last_url = page.url
-                push_history(last_url)
-
-            # scan page for heroku generate link
-            try:
-                cont = await page.content()
-                m = re.search(r'https?://[A-Za-z0-9\-.]+herokuapp\.com/[^\s"\'<>]*generate\?code=[^"&\'<>]+', cont)
-                if m:
-                    result["final_url"] = m.group(0)
-                    try:
-                        result["screenshot_b64"] = await take_screenshot_b64(page)
-                    except Exception:
-                        pass
-                    result["nav_history"] = nav_history
-                    return result
-            except Exception:
-                pass
-
-            # detect captcha-like content
-            try:
-                content = await page.content()
-            except Exception:
-                content = ""
-            if any(k in content.lower() for k in ("captcha", "recaptcha", "hcaptcha", "i am not a robot", "please verify")):
-                result["captcha_detected"] = True
-                try:
-                    result["screenshot_b64"] = await take_screenshot_b64(page)
-                except Exception:
-                    pass
-                result["nav_history"] = nav_history
-                return result
+        # hard per-attempt deadline; cancels whatever the loop is awaiting when it expires
+        try:
+            async with asyncio.timeout(MAX_TOTAL_WAIT):
+                while len(nav_history) < MAX_NAV_HISTORY:
+                    current_url = page.url
+                    result["raw_last_url"] = current_url
 
-            # if left shortener domain, give a short window for dynamic link creation
-            if looks_final(current_url) and current_url != url:
-                extra_end = time.time() + 8
-                while time.time() < extra_end:
+                    # if network discovered interesting url, return it
                     if found_network_urls:
                         chosen = sorted(found_network_urls)[0]
                         result["final_url"] = chosen
-                        try:
-                            result["screenshot_b64"] = await take_screenshot_b64(page)
-                        except Exception:
-                            pass
+                        await snap()
                         result["nav_history"] = nav_history
                         return result
+
+                    # try clicking get link elements
                     click_res = await try_click_getlink_elements(page)
                     if click_res:
                         push_history(page.url)
                         result["final_url"] = click_res
-                        try:
-                            result["screenshot_b64"] = await take_screenshot_b64(page)
-                        except Exception:
-                            pass
+                        await snap()
                         result["nav_history"] = nav_history
                         return result
-                    await page.wait_for_timeout(1000)
 
-                result["final_url"] = page.url
-                try:
-                    result["screenshot_b64"] = await take_screenshot_b64(page)
-                except Exception:
-                    pass
-                result["nav_history"] = nav_history
-                return result
-
-            # fallback: try some generic clicks and continue
-            selectors = [
-                "a#btn-main", "a[href*='redirect']", "a[href*='http']",
-                "a.btn", "button#btn-main", "button", "input[type=submit]", "a[role='button']"
-            ]
-            for sel in selectors:
-                try:
-                    el = await page.query_selector(sel)
-                    if el:
-                        try:
-                            await el.click(timeout=CLICK_TIMEOUT)
-                            await page.wait_for_timeout(1000)
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
+                    # update history if changed
+                    if page.url != last_url:
+                        last_url = page.url
+                        push_history(last_url)
 
-            try:
-                await page.wait_for_load_state("networkidle", timeout=2000)
-            except Exception:
-                pass
+                    # scan page for heroku generate link + captcha in one in-page pass
+                    try:
+                        info = await page.evaluate(DETECT_JS) or {}
+                    except Exception:
+                        info = {}
+                    if info.get("link"):
+                        result["final_url"] = info["link"]
+                        await snap()
+                        result["nav_history"] = nav_history
+                        return result
+
+                    # detect captcha-like content
+                    if info.get("captcha"):
+                        result["captcha_detected"] = True
+                        await snap()
+                        result["nav_history"] = nav_history
+                        return result
+
+                    # if left shortener domain, give a short window for dynamic link creation
+                    if looks_final(current_url) and current_url != url:
+                        extra_end = time.monotonic() + 8
+                        while time.monotonic() < extra_end:
+                            if found_network_urls:
+                                chosen = sorted(found_network_urls)[0]
+                                result["final_url"] = chosen
+                                await snap()
+                                result["nav_history"] = nav_history
+                                return result
+                            click_res = await try_click_getlink_elements(page)
+                            if click_res:
+                                push_history(page.url)
+                                result["final_url"] = click_res
+                                await snap()
+                                result["nav_history"] = nav_history
+                                return result
+                            # wake as soon as the response listener sees a link, else re-probe in 1s
+                            try:
+                                async with asyncio.timeout(1):
+                                    await found_event.wait()
+                            except TimeoutError:
+                                pass
+
+                        result["final_url"] = page.url
+                        await snap()
+                        result["nav_history"] = nav_history
+                        return result
+
+                    # fallback: click the highest-priority generic candidate in-page and continue
+                    try:
+                        before = page.url
+                        # a selector that already worked on this host is tried first
+                        clicked = await page.evaluate(FALLBACK_CLICK_JS, fallback_selectors_for(before))
+                        if clicked:
+                            safe_log("fallback click: %s", clicked)
+                            await wait_for_url_change(page, before, 1000)
+                            # only remembered by the endpoint if this attempt ends up succeeding
+                            if page.url != before:
+                                result["selector_hint"] = (before, clicked)
+                    except Exception:
+                        pass
+
+                    # ad/tracker traffic rarely lets networkidle settle; the DOM being ready is enough
+                    try:
+                        await page.wait_for_load_state("domcontentloaded", timeout=1500)
+                    except Exception:
+                        pass
 
-            if page.url != last_url:
-                last_url = page.url
-                push_history(last_url)
+                    if page.url != last_url:
+                        last_url = page.url
+                        push_history(last_url)
 
-            await page.wait_for_timeout(800)
+                    await wait_for_url_change(page, last_url, 800)
+        except TimeoutError:
+            safe_log("attempt #%d deadline reached", attempt_num)
 
         # ended loop: return last known URL
         result["final_url"] = page.url or result["final_url"]
-        try:
-            result["screenshot_b64"] = await take_screenshot_b64(page)
-        except Exception:
-            pass
+        await snap()
         result["nav_history"] = nav_history
         return result
 
@@ -357,6 +518,272 @@ async def bypass_once(page: Page, url: str, attempt_num: int):
         except Exception:
             pass
 
+async def race_bypass(pages: List[Page], url: str, first_attempt: int, include_screenshot: bool = False):
+    # run one attempt per page at once; the first to land off the shortener wins and the
+    # others are cancelled. Returns (index of the page used, result).
+    async def run(n: int, p: Page):
+        return n, await bypass_once(p, url, first_attempt + n, include_screenshot)
+
+    tasks = [asyncio.create_task(run(n, p)) for n, p in enumerate(pages)]
+    best = None
+    error = None
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                n, res = await fut
+            except Exception as e:
+                error = e
+                continue
+            # keep the first result until a clean final one arrives; a captcha on one page
+            # must not stop the race while the other page can still reach the destination
+            clean = not res.get("captcha_detected") and is_bypassed(res.get("final_url"), url)
+            if best is None or best[1].get("captcha_detected") or clean:
+                best = (n, res)
+            if clean:
+                break
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if best is None:
+        raise error
+    return best
+
+# -----------------------
+# Plain-HTTP fast path (no browser)
+# -----------------------
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    # one keep-alive pool for the process, so repeat lookups to a shortener reuse its TLS connection
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(follow_redirects=True, max_redirects=10, timeout=HTTP_FAST_PATH_TIMEOUT,
+                                         headers={"User-Agent": USER_AGENT},
+                                         limits=httpx.Limits(max_connections=100, keepalive_expiry=60))
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def try_http_fast_path(url: str) -> Optional[List[str]]:
+    # follow server-side redirects only; returns the hop list if it ends off the shortener
+    try:
+        # stream so the destination body (possibly a large download) is never read in full
+        async with get_http_client().stream("GET", url) as r:
+            final = str(r.url)
+            # no redirect at all is not a result, same rule the endpoint applies to the browser
+            if r.status_code >= 400 or not is_bypassed(final, url):
+                return None
+            # an off-shortener HTML page can still be an ad/article interstitial or captcha
+            # that needs the browser's click loop; only its head is checked
+            ctype = r.headers.get("content-type", "")
+            if not ctype or "html" in ctype:
+                head = b""
+                async for chunk in r.aiter_bytes():
+                    head += chunk
+                    if len(head) >= FAST_PATH_SCAN_BYTES:
+                        break
+                text = head[:FAST_PATH_SCAN_BYTES].decode("utf-8", "ignore")
+                if CAPTCHA_TEXT_RE.search(text) or SHORTENER_RE.search(text) or find_heroku_link(text):
+                    safe_log("http fast path landed on an interstitial, using the browser")
+                    return None
+            return [str(h.url) for h in r.history] + [final]
+    except Exception as e:
+        safe_log("http fast path failed: %s", e)
+        return None
+
+# -----------------------
+# Result cache (normalized input URL -> successful response fields)
+# -----------------------
+_result_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def cache_key(url: str) -> str:
+    # scheme/host are case-insensitive, the short code in the path is not
+    parsed = urlparse(url.strip())
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(),
+                           path=parsed.path.rstrip("/"), fragment="").geturl()
+
+def cache_get(key: str) -> Optional[dict]:
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, data = entry
+    if time.monotonic() - stored_at > RESULT_CACHE_TTL:
+        _result_cache.pop(key, None)
+        return None
+    _result_cache.move_to_end(key)
+    return data
+
+def cache_put(key: str, data: dict):
+    _result_cache[key] = (time.monotonic(), data)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+# -----------------------
+# Browser pool (one Chromium per headless mode, reused across requests)
+# -----------------------
+_playwright: Optional[Playwright] = None
+_browsers: Dict[bool, Browser] = {}
+_context_pools: Dict[bool, asyncio.Queue] = {}
+_pool_lock = asyncio.Lock()
+_context_uses: Dict[BrowserContext, int] = {}
+_storage_lock = asyncio.Lock()   # serializes writes/removal of STORAGE_STATE_PATH
+_clear_generation = 0            # bumped by /clear_session
+_context_generation: Dict[BrowserContext, int] = {}   # clear generation each context started in
+
+def is_top_level_navigation(req) -> bool:
+    # the tab itself may be sent to an ad host by a redirect; iframes may not
+    try:
+        return req.is_navigation_request() and req.frame.parent_frame is None
+    except Exception:
+        # service worker requests have no frame
+        return False
+
+async def block_heavy_resources(route: Route):
+    req = route.request
+    if req.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    elif any(h in urlparse(req.url).netloc for h in BLOCKED_HOST_MARKERS) and not is_top_level_navigation(req):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def new_pooled_context(browser: Browser) -> BrowserContext:
+    # start from saved cookies so shortener anti-bot checks already passed are skipped
+    generation = _clear_generation
+    context = None
+    if await asyncio.to_thread(os.path.exists, STORAGE_STATE_PATH):
+        try:
+            context = await browser.new_context(user_agent=USER_AGENT, storage_state=STORAGE_STATE_PATH)
+        except Exception:
+            safe_log("could not load saved storage state, starting fresh")
+    if context is None:
+        context = await browser.new_context(user_agent=USER_AGENT)
+    if BLOCK_ASSETS:
+        await context.route("**/*", block_heavy_resources)
+    await context.new_page()
+    _context_generation[context] = generation
+    return context
+
+def is_stale(context: BrowserContext) -> bool:
+    # started before the last /clear_session, so it still holds the cleared session
+    return _context_generation.get(context) != _clear_generation
+
+async def save_storage_state(context: BrowserContext):
+    async with _storage_lock:
+        if is_stale(context):
+            return
+        try:
+            await context.storage_state(path=STORAGE_STATE_PATH)
+        except Exception:
+            safe_log("could not save storage state")
+
+async def get_context_pool(headless: bool) -> asyncio.Queue:
+    global _playwright
+    # fast path: once warm, concurrent requests only contend on the queue itself
+    pool = _context_pools.get(headless)
+    if pool is not None and _browsers[headless].is_connected():
+        return pool
+    async with _pool_lock:
+        pool = _context_pools.get(headless)
+        if pool is not None and _browsers[headless].is_connected():
+            return pool
+        if pool is not None:
+            logger.warning("Browser (headless=%s) disconnected, relaunching", headless)
+        if _playwright is None:
+            _playwright = await async_playwright().start()
+        if CDP_URL:
+            browser = await _playwright.chromium.connect_over_cdp(CDP_URL)
+        else:
+            browser = await _playwright.chromium.launch(headless=headless, args=BROWSER_ARGS)
+        pool = asyncio.Queue()
+        for _ in range(POOL_SIZE):
+            pool.put_nowait(await new_pooled_context(browser))
+        _browsers[headless] = browser
+        _context_pools[headless] = pool
+        logger.info("Started browser (headless=%s) with %d contexts", headless, POOL_SIZE)
+        return pool
+
+async def acquire_context(headless: bool):
+    # a dead browser cannot refill its queue, so a waiter re-checks the browser every
+    # POOL_WAIT_CHECK seconds and moves to the relaunched pool instead of hanging forever
+    while True:
+        pool = await get_context_pool(headless)
+        try:
+            async with asyncio.timeout(POOL_WAIT_CHECK):
+                context = await pool.get()
+        except TimeoutError:
+            continue
+        browser = context.browser
+        if browser is not None and browser.is_connected():
+            return pool, context
+        # left over from before the crash; it cannot be reused
+        _context_uses.pop(context, None)
+        _context_generation.pop(context, None)
+
+async def release_context(pool: asyncio.Queue, context: BrowserContext):
+    # park the page (cookies are kept on purpose); replace the context if it is broken,
+    # predates the last /clear_session, or has served MAX_CONTEXT_USES requests, since
+    # long-lived contexts keep growing in memory
+    uses = _context_uses.pop(context, 0) + 1
+    if uses < MAX_CONTEXT_USES and not is_stale(context):
+        try:
+            # popups/tabs opened by get-link clicks would keep loading ads while pooled
+            for extra in context.pages[1:]:
+                await extra.close()
+            page = context.pages[0] if context.pages else await context.new_page()
+            await page.goto("about:blank")
+            _context_uses[context] = uses
+            pool.put_nowait(context)
+            return
+        except Exception:
+            safe_log("context reset failed, replacing it")
+    else:
+        await save_storage_state(context)
+    await replace_context(pool, context)
+
+async def replace_context(pool: asyncio.Queue, context: BrowserContext):
+    browser = context.browser
+    _context_generation.pop(context, None)
+    try:
+        await context.close()
+    except Exception:
+        pass
+    try:
+        context = await new_pooled_context(browser)
+    except Exception:
+        logger.exception("Could not replace pooled context")
+        return
+    pool.put_nowait(context)
+
+async def close_browser_pool():
+    global _playwright
+    # save one context's cookies for the next process start
+    for pool in _context_pools.values():
+        if not pool.empty():
+            await save_storage_state(pool.get_nowait())
+            break
+    for browser in _browsers.values():
+        try:
+            await browser.close()
+        except Exception:
+            pass
+    _browsers.clear()
+    _context_pools.clear()
+    _context_uses.clear()
+    _context_generation.clear()
+    if _playwright is not None:
+        try:
+            await _playwright.stop()
+        except Exception:
+            pass
+        _playwright = None
+
 # -----------------------
 # POST /bypass (with robust error handling)
 # -----------------------
@@ -379,52 +806,87 @@ async def bypass_endpoint(req: BypassRequest, x_api_key: Optional[str] = Header(
 
         logger.info("Received bypass request")
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=headless, args=["--no-sandbox", "--disable-dev-shm-usage"])
-            context = await browser.new_context(user_agent=USER_AGENT)
-            page = await context.new_page()
-
-            final = {"final_url": url, "raw_last_url": url, "captcha_detected": False, "screenshot_b64": None}
-            attempt_made = 0
+        # screenshot requests always need the browser; otherwise try the cache and plain HTTP first
+        key = cache_key(url)
+        if not include_screenshot:
+            cached = cache_get(key)
+            if cached:
+                logger.info("Serving cached bypass result")
+                return BypassResponse(**cached)
+
+            # many links are plain 30x redirects; resolve those without starting a browser page
+            hops = await try_http_fast_path(url)
+            if hops:
+                logger.info("Resolved via HTTP redirects")
+                resp = BypassResponse(final_url=hops[-1], raw_last_url=hops[-1], captcha_detected=False,
+                                      attempts_made=0, nav_history=hops)
+                cache_put(key, resp.model_dump(exclude={"screenshot_b64"}))
+                return resp
+
+        pool, context = await acquire_context(headless)
+        # race the first two attempts on a second warm context, but only if a third would
+        # still be idle afterwards; otherwise the next request would queue behind the race
+        racer = None
+        if attempts > 1 and pool.qsize() > 1:
             try:
-                for i in range(1, attempts + 1):
-                    attempt_made = i
-                    # small human-like action
-                    try:
-                        await page.mouse.move(120, 120)
-                    except Exception:
-                        pass
-
-                    res = await bypass_once(page, url, i)
-                    final.update(res)
-
-                    if res.get("captcha_detected"):
-                        break
-                    if looks_final(final.get("final_url")) and "gplinks" not in (final.get("final_url") or "").lower():
-                        break
+                racer = pool.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
 
-                    if i < attempts:
-                        backoff = (2 ** i) + 0.5 * i
-                        logger.info("Waiting %.1fs before retry %d", backoff, i + 1)
-                        await page.wait_for_timeout(int(backoff * 1000))
-                        try:
-                            await page.reload(timeout=5000)
-                            await page.wait_for_timeout(1000)
-                        except Exception:
-                            pass
-            finally:
-                try:
-                    await context.close()
-                except Exception:
-                    pass
+        final = {"final_url": url, "raw_last_url": url, "captcha_detected": False, "screenshot": None}
+        attempt_made = 0
+        state_saved = False
+        try:
+            page = context.pages[0] if context.pages else await context.new_page()
+            while attempt_made < attempts:
+                if attempt_made:
+                    backoff = retry_backoff(url, attempt_made)
+                    logger.info("Waiting %.1fs before retry %d", backoff, attempt_made + 1)
+                    # no reload here: the next bypass_once starts with a fresh goto of the link
+                    await asyncio.sleep(backoff)
+
+                # small human-like action
                 try:
-                    await browser.close()
+                    await page.mouse.move(120, 120)
                 except Exception:
                     pass
 
-        b64 = final.get("screenshot_b64") if include_screenshot else None
-
-        return BypassResponse(
+                if racer is not None:
+                    racer_page = racer.pages[0] if racer.pages else await racer.new_page()
+                    try:
+                        won, res = await race_bypass([page, racer_page], url, attempt_made + 1, include_screenshot)
+                        if won and not res.get("captcha_detected") and is_bypassed(res.get("final_url"), url):
+                            await save_storage_state(racer)
+                            state_saved = True
+                    finally:
+                        await release_context(pool, racer)
+                        racer = None
+                    attempt_made += 2
+                else:
+                    attempt_made += 1
+                    res = await bypass_once(page, url, attempt_made, include_screenshot)
+                final.update(res)
+
+                if res.get("captcha_detected"):
+                    break
+                if is_bypassed(final.get("final_url"), url):
+                    break
+
+            if not final.get("captcha_detected") and is_bypassed(final.get("final_url"), url):
+                # persist cookies from a successful run so later contexts skip the warm-up
+                if not state_saved:
+                    await save_storage_state(context)
+                if final.get("selector_hint"):
+                    remember_selector(*final["selector_hint"])
+        finally:
+            if racer is not None:
+                await release_context(pool, racer)
+            await release_context(pool, context)
+
+        shot = final.get("screenshot") if include_screenshot else None
+        b64 = base64.b64encode(shot).decode("ascii") if shot else None
+
+        resp = BypassResponse(
             final_url=final.get("final_url") or url,
             raw_last_url=final.get("raw_last_url") or url,
             captcha_detected=bool(final.get("captcha_detected")),
@@ -432,6 +894,9 @@ async def bypass_endpoint(req: BypassRequest, x_api_key: Optional[str] = Header(
             attempts_made=attempt_made,
             nav_history=final.get("nav_history") or []
         )
+        if not resp.captcha_detected and is_bypassed(resp.final_url, url):
+            cache_put(key, resp.model_dump(exclude={"screenshot_b64"}))
+        return resp
 
     except HTTPException as he:
         # bubble up HTTPExceptions with their detail
@@ -441,6 +906,32 @@ async def bypass_endpoint(req: BypassRequest, x_api_key: Optional[str] = Header(
         # Return a JSON response with error detail so the UI receives it
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+# -----------------------
+# POST /clear_session (forget saved shortener cookies)
+# -----------------------
+@app.post("/clear_session")
+async def clear_session(x_api_key: Optional[str] = Header(None)):
+    if API_KEY:
+        if not x_api_key or x_api_key != API_KEY:
+            raise HTTPException(status_code=401, detail="Missing/invalid API key")
+
+    global _clear_generation
+    async with _storage_lock:
+        # contexts from before this point may no longer save state and are recycled on release
+        _clear_generation += 1
+        try:
+            await asyncio.to_thread(os.remove, STORAGE_STATE_PATH)
+        except FileNotFoundError:
+            pass
+
+    # idle pooled contexts are replaced now, dropping localStorage along with the cookies
+    for pool in _context_pools.values():
+        idle = [pool.get_nowait() for _ in range(pool.qsize())]
+        for context in idle:
+            await replace_context(pool, context)
+
+    return {"status": "cleared"}
+
 # -----------------------
 # Health and Web UI
 # -----------------------
@@ -524,8 +1015,8 @@ async function startBypass(){
     let html = `<pre>✅ Final URL: ${data.final_url}\nAttempts: ${data.attempts_made}\nCaptcha Detected: ${data.captcha_detected}\nRaw Last URL: ${data.raw_last_url}\nNavigation history: ${JSON.stringify(data.nav_history||[])} </pre>`;
     html += `<p><button onclick="window.open('${esc(data.final_url)}','_blank')">Open final URL</button></p>`;
     if(data.screenshot_b64){
-      html += `<p><a href="data:image/png;base64,${data.screenshot_b64}" download="screenshot.png">Download screenshot</a></p>`;
-      html += `<p><img class="debug" src="data:image/png;base64,${data.screenshot_b64}" /></p>`;
+      html += `<p><a href="data:image/jpeg;base64,${data.screenshot_b64}" download="screenshot.jpg">Download screenshot</a></p>`;
+      html += `<p><img class="debug" src="data:image/jpeg;base64,${data.screenshot_b64}" /></p>`;
     }
     document.getElementById('output').innerHTML = html;
   } catch (e) {
@@ -537,4 +1028,11 @@ async function startBypass(){
 </script>
 </body>
 </html>
-"""
\ No newline at end of file
+"""
+
+if __name__ == "__main__":
+    import sys
+    import uvicorn
+    # uvloop ships with uvicorn[standard] but has no Windows build
+    loop = "uvloop" if sys.platform != "win32" else "asyncio"
+    uvicorn.run(app, host="0.0.0.0", port=APP_PORT, loop=loop)